@@ -1,18 +1,45 @@
 # backend/main.py - Mini RAG Backend API
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import Optional
 import rag_pipeline
 import mock_rag_pipeline
 import os
-import PyPDF2
-import io
+import asyncio
+import tempfile
+import hashlib
+import json
+import uuid
+import threading
+import itertools
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+import aiofiles
+import orjson
+import fitz  # PyMuPDF
+from config import STATE_FILE
 
-app = FastAPI(title="Mini RAG API", description="Retrieval-Augmented Generation API")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Restore the retriever for the last indexed document before serving requests."""
+    await asyncio.to_thread(restore_retriever)
+    yield
+
+app = FastAPI(
+    title="Mini RAG API",
+    lifespan=lifespan,
+    description="Retrieval-Augmented Generation API"
+)
 
 # Demo mode toggle - set to True to use mock pipeline (no API keys required)
 DEMO_MODE = os.getenv("DEMO_MODE", "true").lower() == "true"
+MODE_MSG = " (Demo Mode)" if DEMO_MODE else ""
+
+# The pipeline is chosen once here; both modules expose the same functions,
+# so the handlers below never branch on DEMO_MODE.
+PIPELINE = mock_rag_pipeline if DEMO_MODE else rag_pipeline
 
 # Configure CORS - Allow all origins for demo deployment
 app.add_middleware(
@@ -23,9 +50,80 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# In-memory storage for the retriever. In a real app, you'd persist this differently.
+# In-memory storage for the retriever. The id of the indexed document is also
+# written to STATE_FILE so the retriever can be rebuilt after a restart.
 retriever = None
 vectorstore = None
+# Identifies the currently indexed document; bumped on every upload so
+# cached answers for a previous document are never served.
+vectorstore_id = uuid.uuid4().hex
+
+# Exact-match LRU cache of /query responses, keyed by query hash + vectorstore_id
+QUERY_CACHE_SIZE = 256
+query_cache = OrderedDict()
+query_cache_hits = 0
+# Results are stored from Starlette's threadpool while the event loop reads them
+query_cache_lock = threading.Lock()
+
+def reset_query_cache():
+    """
+    Invalidate cached answers after a new document has been indexed. Must run
+    right after `retriever` is reassigned, so no query can cache an answer
+    from the old retriever once the caches are cleared.
+    """
+    global vectorstore_id
+    vectorstore_id = uuid.uuid4().hex
+    with query_cache_lock:
+        query_cache.clear()
+    PIPELINE.reset_answer_cache()
+
+def document_id(text: str, source_name: str) -> str:
+    """
+    Identify an uploaded document by its text and source name; the source name
+    is stored in chunk metadata, so the same text under another name is a
+    different document.
+    """
+    return hashlib.sha256(f"{source_name}\0{text}".encode("utf-8")).hexdigest()
+
+def save_state(doc_id: str):
+    """Record which document namespace is currently indexed."""
+    with open(STATE_FILE, "w") as f:
+        json.dump({"doc_id": doc_id}, f)
+
+def load_state() -> Optional[str]:
+    """Return the document namespace recorded by save_state, if any."""
+    try:
+        with open(STATE_FILE) as f:
+            return json.load(f).get("doc_id")
+    except (OSError, ValueError):
+        return None
+
+async def _run_inline(func, *args, **kwargs):
+    return func(*args, **kwargs)
+
+def _skip_state(doc_id: str):
+    pass
+
+# The real pipeline blocks on network I/O (Gemini, Pinecone, Cohere, Groq), so
+# its calls run in worker threads to keep the event loop free. The mock
+# pipeline is in-memory and fast, and keeps nothing worth restoring.
+run_pipeline = _run_inline if DEMO_MODE else asyncio.to_thread
+record_indexed_document = _skip_state if DEMO_MODE else save_state
+
+def restore_retriever():
+    """Rebuild the retriever for the last indexed document without re-embedding it."""
+    global retriever, vectorstore
+    if DEMO_MODE:
+        return
+    doc_id = load_state()
+    if doc_id is None:
+        return
+    try:
+        vectorstore = rag_pipeline.load_vectorstore(doc_id)
+        retriever = rag_pipeline.configure_retriever_and_reranker(vectorstore)
+        reset_query_cache()
+    except Exception as e:
+        print(f"Warning: could not restore retriever for {doc_id} ({e})")
 
 class QueryRequest(BaseModel):
     query: str
@@ -34,14 +132,34 @@ class TextUploadRequest(BaseModel):
     text: str
     source_name: Optional[str] = "Direct Input"
 
-def extract_text_from_pdf(file_content: bytes) -> str:
-    """Extract text from PDF file content."""
+# Uploads are copied to disk in chunks of this size rather than read whole.
+UPLOAD_CHUNK_SIZE = 1 << 20
+
+async def save_upload_to_tempfile(file: UploadFile) -> str:
+    """Stream an uploaded file to a temporary file and return its path."""
+    suffix = os.path.splitext(file.filename)[1]
+    with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp:
+        tmp_path = tmp.name
+    try:
+        async with aiofiles.open(tmp_path, "wb") as out:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                await out.write(chunk)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+    return tmp_path
+
+# PyMuPDF's default "text" flags, with image blocks explicitly excluded so the
+# extraction stays text-only even if that default changes.
+PDF_TEXT_FLAGS = fitz.TEXTFLAGS_TEXT & ~fitz.TEXT_PRESERVE_IMAGES
+
+def extract_text_from_pdf(file_path: str) -> str:
+    """Extract text from a PDF file on disk."""
     try:
-        pdf_reader = PyPDF2.PdfReader(io.BytesIO(file_content))
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text() + "\n"
-        return text.strip()
+        # Plain "text" extraction skips the layout analysis done by "dict"/"html"
+        with fitz.open(file_path, filetype="pdf") as doc:
+            pages = [page.get_text("text", flags=PDF_TEXT_FLAGS, sort=False) for page in doc]
+        return "\n".join(pages).strip()
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Error reading PDF: {str(e)}")
 
@@ -57,31 +175,31 @@ async def upload_document(file: UploadFile = File(...)):
         raise HTTPException(status_code=400, detail="Only .txt and .pdf files are supported.")
     
     try:
-        content_bytes = await file.read()
-        
-        # Extract text based on file type
-        if file.filename.endswith(".pdf"):
-            content = extract_text_from_pdf(content_bytes)
-        else:  # .txt file
-            content = content_bytes.decode("utf-8")
+        tmp_path = await save_upload_to_tempfile(file)
+        try:
+            # Extract text based on file type
+            if file.filename.endswith(".pdf"):
+                # Run extraction off the event loop so other requests keep being served
+                content = await asyncio.to_thread(extract_text_from_pdf, tmp_path)
+            else:  # .txt file
+                async with aiofiles.open(tmp_path, "r", encoding="utf-8") as f:
+                    content = await f.read()
+        finally:
+            os.unlink(tmp_path)
         
         if not content.strip():
             raise HTTPException(status_code=400, detail="No text content found in the file.")
         
-        if DEMO_MODE:
-            # Use mock pipeline
-            documents = mock_rag_pipeline.mock_get_text_chunks(content, source_name=file.filename)
-            vectorstore = mock_rag_pipeline.mock_get_vectorstore(documents)
-            retriever = mock_rag_pipeline.mock_configure_retriever_and_reranker(vectorstore)
-        else:
-            # Use real pipeline
-            documents = rag_pipeline.get_text_chunks(content, source_name=file.filename)
-            vectorstore = rag_pipeline.get_vectorstore(documents)
-            retriever = rag_pipeline.configure_retriever_and_reranker(vectorstore)
+        doc_id = document_id(content, file.filename)
+        documents = await run_pipeline(PIPELINE.get_text_chunks, content, source_name=file.filename)
+        vectorstore = await run_pipeline(PIPELINE.get_vectorstore, documents, namespace=doc_id)
+        retriever = await run_pipeline(PIPELINE.configure_retriever_and_reranker, vectorstore)
+        record_indexed_document(doc_id)
+        
+        reset_query_cache()
         
-        mode_msg = " (Demo Mode)" if DEMO_MODE else ""
         file_type = "PDF" if file.filename.endswith(".pdf") else "text"
-        return {"message": f"Successfully processed and indexed {file_type} file: {file.filename}.{mode_msg}"}
+        return {"message": f"Successfully processed and indexed {file_type} file: {file.filename}.{MODE_MSG}"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -96,49 +214,83 @@ async def upload_text(request: TextUploadRequest):
         raise HTTPException(status_code=400, detail="Text content cannot be empty.")
     
     try:
-        if DEMO_MODE:
-            # Use mock pipeline
-            documents = mock_rag_pipeline.mock_get_text_chunks(request.text, source_name=request.source_name)
-            vectorstore = mock_rag_pipeline.mock_get_vectorstore(documents)
-            retriever = mock_rag_pipeline.mock_configure_retriever_and_reranker(vectorstore)
-        else:
-            # Use real pipeline
-            documents = rag_pipeline.get_text_chunks(request.text, source_name=request.source_name)
-            vectorstore = rag_pipeline.get_vectorstore(documents)
-            retriever = rag_pipeline.configure_retriever_and_reranker(vectorstore)
+        doc_id = document_id(request.text, request.source_name)
+        documents = await run_pipeline(PIPELINE.get_text_chunks, request.text, source_name=request.source_name)
+        vectorstore = await run_pipeline(PIPELINE.get_vectorstore, documents, namespace=doc_id)
+        retriever = await run_pipeline(PIPELINE.configure_retriever_and_reranker, vectorstore)
+        record_indexed_document(doc_id)
+        
+        reset_query_cache()
         
-        mode_msg = " (Demo Mode)" if DEMO_MODE else ""
-        return {"message": f"Successfully processed and indexed text from {request.source_name}.{mode_msg}"}
+        return {"message": f"Successfully processed and indexed text from {request.source_name}.{MODE_MSG}"}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+def _sse(event: str, data) -> bytes:
+    """Encode one server-sent event with a JSON payload."""
+    return b"event: " + event.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+
+def _cache_on_done(events, cache_key: str):
+    """Pass pipeline events through, caching the final result once it arrives."""
+    for event, data in events:
+        if event == "done":
+            with query_cache_lock:
+                query_cache[cache_key] = data
+                if len(query_cache) > QUERY_CACHE_SIZE:
+                    query_cache.popitem(last=False)
+            data = {**data, "cache": {"hit": False, "hits": query_cache_hits}}
+        yield event, data
+
+def _sse_stream(events):
+    """Turn (event, data) pairs into SSE frames, reporting failures as an error event."""
+    try:
+        for event, data in events:
+            yield _sse(event, data)
+    except Exception as e:
+        # The 200 status has already been sent, so the error goes in-band
+        yield _sse("error", {"detail": str(e)})
+
 @app.post("/query")
 async def handle_query(request: QueryRequest):
     """
-    Endpoint to ask a question and get a cited answer.
+    Endpoint to ask a question and stream back a cited answer as server-sent events.
+    - event: token - a piece of the answer text
+    - event: done - the full result (answer, sources, timing, cost_breakdown, token_usage, cache)
+    - event: error - {"detail": ...} if answering fails after the stream has started
+    Failures before the first event (e.g. retrieval) are reported as a regular 500.
     """
-    global retriever
+    global retriever, query_cache_hits
     if retriever is None:
         raise HTTPException(status_code=400, detail="No document has been uploaded and processed yet.")
     
-    try:
-        if DEMO_MODE:
-            # Use mock pipeline
-            result = mock_rag_pipeline.mock_get_answer(request.query, retriever)
-        else:
-            # Use real pipeline
-            result = rag_pipeline.get_answer(request.query, retriever)
-        
-        # Convert Document objects to dicts for JSON serialization (real pipeline)
-        if not DEMO_MODE and 'sources' in result:
-            result['sources'] = [
-                {"page_content": doc.page_content, "metadata": doc.metadata}
-                for doc in result['sources']
-            ]
-        
-        return result
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    cache_key = hashlib.sha256(request.query.encode("utf-8")).hexdigest() + vectorstore_id
+    with query_cache_lock:
+        cached = query_cache.get(cache_key)
+        if cached is not None:
+            query_cache.move_to_end(cache_key)
+    if cached is not None:
+        query_cache_hits += 1
+        events = iter([
+            ("token", cached["answer"]),
+            ("done", {**cached, "cache": {"hit": True, "hits": query_cache_hits}})
+        ])
+    else:
+        # Calling a generator runs nothing, so pull the first event here: errors
+        # before streaming starts still get a proper HTTP status
+        try:
+            events = PIPELINE.stream_answer(request.query, retriever)
+            first_event = await run_pipeline(next, events, None)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        events = _cache_on_done(itertools.chain([first_event] if first_event else [], events), cache_key)
+    
+    # Starlette iterates this synchronous generator in its threadpool, so the
+    # blocking LLM stream does not hold up the event loop.
+    return StreamingResponse(
+        _sse_stream(events),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
 
 # Health check endpoint
 @app.get("/")
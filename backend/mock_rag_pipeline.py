@@ -1,16 +1,34 @@
 # backend/mock_rag_pipeline.py
 """
-Mock RAG pipeline for testing without API keys
+Mock RAG pipeline for testing without API keys.
+Exposes the same functions as rag_pipeline so main.py can use either module.
 """
 import time
 import re
 from typing import List, Dict, Any
+import numpy as np
+from rank_bm25 import BM25Okapi
 
 # Mock document storage
 mock_documents = []
 mock_processed = False
 
-def mock_get_text_chunks(text_content: str, source_name: str):
+# Okapi BM25 index over the chunks, built once at ingest time
+mock_bm25 = None
+
+# Word -> bit index, and one packed uint64 bitset row per chunk marking the
+# words it contains; used to find candidate chunks before BM25 scoring.
+mock_vocab = {}
+mock_doc_bits = None
+
+def _word_bits(word_indices, n_words: int) -> np.ndarray:
+    """Pack vocabulary indices into a uint64 bitset of ceil(n_words / 64) words."""
+    word_indices = np.asarray(word_indices, dtype=np.uint64)
+    bits = np.zeros((n_words + 63) // 64, dtype=np.uint64)
+    np.bitwise_or.at(bits, (word_indices >> np.uint64(6)).astype(np.intp), np.uint64(1) << (word_indices & np.uint64(63)))
+    return bits
+
+def get_text_chunks(text_content: str, source_name: str):
     """Mock text chunking"""
     global mock_documents, mock_processed
     
@@ -33,15 +51,28 @@ def mock_get_text_chunks(text_content: str, source_name: str):
     mock_processed = True
     return chunks
 
-def mock_get_vectorstore(documents):
-    """Mock vector store creation"""
+def get_vectorstore(documents, namespace: str = ""):
+    """Mock vector store creation (builds a BM25 index and word bitsets over the chunks; namespace is ignored)"""
+    global mock_bm25, mock_vocab, mock_doc_bits
+    doc_tokens = [doc["page_content"].lower().split() for doc in documents]
+    mock_bm25 = BM25Okapi(doc_tokens)
+    
+    mock_vocab = {}
+    doc_word_indices = [
+        [mock_vocab.setdefault(word, len(mock_vocab)) for word in set(tokens)]
+        for tokens in doc_tokens
+    ]
+    mock_doc_bits = np.stack([_word_bits(indices, len(mock_vocab)) for indices in doc_word_indices])
     return {"status": "created", "documents": len(documents)}
 
-def mock_configure_retriever_and_reranker(vectorstore):
+def reset_answer_cache():
+    """Mock answer cache reset (the mock pipeline caches no answers)"""
+
+def configure_retriever_and_reranker(vectorstore):
     """Mock retriever configuration"""
     return {"status": "configured"}
 
-def mock_get_answer(query: str, retriever):
+def get_answer(query: str, retriever):
     """Mock answer generation with citations"""
     global mock_documents
     
@@ -70,17 +101,24 @@ def mock_get_answer(query: str, retriever):
     
     start_time = time.time()
     
-    # Simple keyword matching for demo
-    query_words = set(query.lower().split())
-    relevant_docs = []
-    
-    for doc in mock_documents:
-        doc_words = set(doc["page_content"].lower().split())
-        if query_words.intersection(doc_words):
-            relevant_docs.append(doc)
+    # Keyword retrieval for demo: a single bitwise AND over all chunk bitsets finds
+    # the chunks sharing a word with the query, and only those are BM25-scored
+    query_tokens = query.lower().split()
+    query_word_indices = [mock_vocab[word] for word in set(query_tokens) if word in mock_vocab]
+    if query_word_indices:
+        query_bits = _word_bits(query_word_indices, len(mock_vocab))
+        candidates = np.flatnonzero(np.bitwise_and(mock_doc_bits, query_bits).any(axis=1))
+    else:
+        candidates = np.empty(0, dtype=np.intp)
+    scores = np.asarray(mock_bm25.get_batch_scores(query_tokens, candidates.tolist()))
     
-    # Take top 3 most relevant (mock reranking)
-    relevant_docs = relevant_docs[:3]
+    # Take top 3 most relevant (mock reranking) without sorting every score
+    top_k = min(3, len(scores))
+    top_positions = np.argpartition(scores, -top_k)[-top_k:] if top_k else candidates
+    top_positions = top_positions[np.argsort(-scores[top_positions], kind="stable")]
+    # Every candidate shares a word with the query, so even a zero BM25 score
+    # (e.g. a word that appears in half the chunks) still counts as relevant
+    relevant_docs = [mock_documents[candidates[i]] for i in top_positions]
     
     if not relevant_docs:
         answer = "Based on the provided documents, I cannot find specific information to answer this question."
@@ -123,3 +161,8 @@ def mock_get_answer(query: str, retriever):
             "total_llm_tokens": context_tokens + query_tokens + output_tokens
         }
     }
+
+def stream_answer(query: str, retriever):
+    """Mock streaming answer: the answer is computed up front and emitted as one token"""
+    result = get_answer(query, retriever)
+    return iter([("token", result["answer"]), ("done", result)])
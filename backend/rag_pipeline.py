@@ -1,30 +1,168 @@
 # backend/rag_pipeline.py
 from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain_pinecone import PineconeVectorStore
+from pinecone import Pinecone
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from langchain_cohere import CohereRerank
 from langchain_groq import ChatGroq
 from langchain.chains import RetrievalQA
 from langchain.prompts import PromptTemplate
-from langchain.schema.runnable import RunnablePassthrough
 from langchain.retrievers.document_compressors import DocumentCompressorPipeline
 from langchain.retrievers import ContextualCompressionRetriever
 from langchain.docstore.document import Document
+from langchain.embeddings import CacheBackedEmbeddings
+from langchain.storage import LocalFileStore
 import tiktoken
 import time
+import functools
+import threading
+import re
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 
-from config import PINECONE_INDEX_NAME, GOOGLE_API_KEY, COHERE_API_KEY, GROQ_API_KEY
+from config import PINECONE_API_KEY, PINECONE_INDEX_NAME, GOOGLE_API_KEY, COHERE_API_KEY, GROQ_API_KEY, EMBEDDING_CACHE_DIR
 
 # Token counting utility
+@functools.lru_cache(maxsize=4)
+def _enc(model: str):
+    """Look up (and cache) the tiktoken encoding for a model."""
+    return tiktoken.encoding_for_model(model)
+
 def count_tokens(text: str, model: str = "gpt-3.5-turbo") -> int:
     """Count tokens in text using tiktoken."""
     try:
-        encoding = tiktoken.encoding_for_model(model)
-        return len(encoding.encode(text))
+        # Treat special-token strings in user documents as plain text
+        return len(_enc(model).encode(text, disallowed_special=()))
     except:
         # Fallback estimation: ~4 chars per token
         return len(text) // 4
 
+def count_tokens_batch(texts: list, model: str = "gpt-3.5-turbo") -> int:
+    """Count the total tokens across several texts with a single batched encode."""
+    try:
+        return sum(map(len, _enc(model).encode_batch(texts, disallowed_special=())))
+    except:
+        # Fallback estimation: ~4 chars per token
+        return sum(len(text) // 4 for text in texts)
+
+# Shared embedding client, reused for document upserts and query caching
+_embeddings = None
+
+def get_embeddings():
+    """
+    Return the Gemini embedding client, creating it on first use.
+    Document embeddings are cached on disk keyed by a sha256 of the chunk text,
+    so re-uploaded or overlapping chunks are not sent to the embedding API again.
+    """
+    global _embeddings
+    if _embeddings is None:
+        underlying = GoogleGenerativeAIEmbeddings(
+            model="models/text-embedding-004",
+            google_api_key=GOOGLE_API_KEY
+        )
+        _embeddings = CacheBackedEmbeddings.from_bytes_store(
+            underlying,
+            LocalFileStore(EMBEDDING_CACHE_DIR),
+            namespace="text-embedding-004",
+            batch_size=100,
+            key_encoder="sha256"
+        )
+    return _embeddings
+
+# Semantic query cache: answers are reused for queries whose embedding has
+# cosine similarity above the threshold with a previously answered query.
+# Embeddings live in one contiguous float32 matrix so a lookup is a single
+# matrix-vector product.
+SEMANTIC_CACHE_THRESHOLD = 0.95
+SEMANTIC_CACHE_SIZE = 128
+_semantic_cache_vectors = None
+_semantic_cache_results = []
+_semantic_cache_last_used = np.zeros(SEMANTIC_CACHE_SIZE, dtype=np.int64)
+_semantic_cache_clock = 0
+# Bumped on every reset, so a query that started before a new document was
+# indexed cannot store its (now stale) answer afterwards
+_semantic_cache_generation = 0
+# get_answer may run on several worker threads at once
+_semantic_cache_lock = threading.Lock()
+
+def reset_answer_cache():
+    """
+    Drop all cached answers. Call this only once the retriever for a new
+    document is in place: a query still using the old retriever before that
+    point would otherwise cache an old-document answer under the new generation.
+    """
+    global _semantic_cache_vectors, _semantic_cache_results, _semantic_cache_generation
+    with _semantic_cache_lock:
+        _semantic_cache_vectors = None
+        _semantic_cache_results = []
+        _semantic_cache_generation += 1
+
+def _embed_query(query: str) -> np.ndarray:
+    """Embed a query and normalize it so dot products are cosine similarities."""
+    vector = np.asarray(get_embeddings().embed_query(query), dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+def _retrieve(query: str, query_vector: np.ndarray, retriever):
+    """
+    Runs a retriever built by configure_retriever_and_reranker, searching with
+    the query embedding already computed for the semantic cache instead of
+    embedding the query a second time. The index uses cosine similarity, so
+    the normalized vector ranks the same as the raw one.
+    """
+    if isinstance(retriever, ContextualCompressionRetriever):
+        base_retriever, reranker = retriever.base_retriever, retriever.base_compressor
+    else:
+        base_retriever, reranker = retriever, None
+    documents = base_retriever.vectorstore.similarity_search_by_vector(
+        query_vector.tolist(), **base_retriever.search_kwargs
+    )
+    if reranker is not None:
+        documents = list(reranker.compress_documents(documents, query))
+    return documents
+
+def _semantic_cache_lookup(query_vector: np.ndarray):
+    """
+    Return (cached result, cache generation) for the most similar prior query.
+    The result is None if nothing is close enough; the generation is passed
+    back to _semantic_cache_store.
+    """
+    global _semantic_cache_clock
+    with _semantic_cache_lock:
+        count = len(_semantic_cache_results)
+        if count == 0:
+            return None, _semantic_cache_generation
+        similarities = _semantic_cache_vectors[:count] @ query_vector
+        best = int(np.argmax(similarities))
+        if similarities[best] < SEMANTIC_CACHE_THRESHOLD:
+            return None, _semantic_cache_generation
+        _semantic_cache_clock += 1
+        _semantic_cache_last_used[best] = _semantic_cache_clock
+        return _semantic_cache_results[best], _semantic_cache_generation
+
+def _semantic_cache_store(query_vector: np.ndarray, result: dict, generation: int):
+    """
+    Add a result to the semantic cache, evicting the least recently used entry when full.
+    Nothing is stored if the cache was reset since the lookup that returned `generation`.
+    """
+    global _semantic_cache_vectors, _semantic_cache_clock
+    with _semantic_cache_lock:
+        if generation != _semantic_cache_generation:
+            return
+        if _semantic_cache_vectors is None:
+            _semantic_cache_vectors = np.zeros((SEMANTIC_CACHE_SIZE, query_vector.shape[0]), dtype=np.float32)
+        count = len(_semantic_cache_results)
+        if count < SEMANTIC_CACHE_SIZE:
+            slot = count
+            _semantic_cache_results.append(result)
+        else:
+            slot = int(np.argmin(_semantic_cache_last_used))
+            _semantic_cache_results[slot] = result
+        _semantic_cache_vectors[slot] = query_vector
+        _semantic_cache_clock += 1
+        _semantic_cache_last_used[slot] = _semantic_cache_clock
+
 # Cost estimation utility
 def estimate_costs(embedding_tokens: int, llm_input_tokens: int, llm_output_tokens: int) -> dict:
     """Estimate costs based on current API pricing (approximate)."""
@@ -50,65 +188,132 @@ def estimate_costs(embedding_tokens: int, llm_input_tokens: int, llm_output_toke
     }
 
 # 1. Chunking Strategy
+# A section starts at a Markdown heading ("# ", "## ", "### ") or at a line
+# underlined with "===".
+SECTION_BOUNDARY = re.compile(r'^(?=#{1,3} |[A-Z][A-Za-z ]+\n={3,})', re.MULTILINE)
+SECTION_HEADER = re.compile(r'#{1,3} (.+)|([A-Z][A-Za-z ]+)\n={3,}')
+CHUNK_SIZE = 1000
+CHUNK_OVERLAP = 150
+
+def split_sections(text_content: str):
+    """
+    Splits text on heading boundaries into (section title, section text) pairs.
+    Heading-only sections (e.g. a "##" directly followed by "###") are folded
+    into the section that follows them.
+    """
+    sections = []
+    # Heading-only sections waiting to be joined, once, onto the next section
+    pending_headings = []
+    pending_title = ""
+    for section in SECTION_BOUNDARY.split(text_content):
+        section = section.strip()
+        if not section:
+            continue
+        header = SECTION_HEADER.match(section)
+        title = (header.group(1) or header.group(2)).strip() if header else ""
+        if header and not section[header.end():].strip():
+            pending_headings.append(section)
+            pending_title = title
+            continue
+        pending_headings.append(section)
+        sections.append((title, "\n\n".join(pending_headings)))
+        pending_headings = []
+    if pending_headings:
+        sections.append((pending_title, "\n\n".join(pending_headings)))
+    return sections
+
 def get_text_chunks(text_content: str, source_name: str):
     """
-    Splits the text into chunks using a token-based strategy.
+    Splits the text into one chunk per section, falling back to a token-based
+    split for sections that are too long.
     - Chunk size: 1000 tokens
     - Chunk overlap: 15% (150 tokens)
-    - Metadata: source, title (use source_name), section (not used), position (chunk_index)
+    - Metadata: source, title (use source_name), section (heading text), position (chunk_index)
     """
     text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=1000,
-        chunk_overlap=150,
-        length_function=len
+        chunk_size=CHUNK_SIZE,
+        chunk_overlap=CHUNK_OVERLAP,
+        length_function=count_tokens
     )
-    chunks = text_splitter.split_text(text_content)
     
     documents = []
-    for i, chunk in enumerate(chunks):
-        doc = Document(
-            page_content=chunk, 
-            metadata={
-                "source": source_name,
-                "title": source_name,
-                "position": i + 1
-            }
-        )
-        documents.append(doc)
+    for section_title, section_text in split_sections(text_content):
+        if count_tokens(section_text) <= CHUNK_SIZE:
+            chunks = [section_text]
+        else:
+            chunks = text_splitter.split_text(section_text)
+        for chunk in chunks:
+            doc = Document(
+                page_content=chunk, 
+                metadata={
+                    "source": source_name,
+                    "title": source_name,
+                    "section": section_title,
+                    "position": len(documents) + 1
+                }
+            )
+            documents.append(doc)
     return documents
 
 # 2. Vector Store and Upsert Logic
-def get_vectorstore(documents):
+# Upserts are sent in batches of this size, several batches in flight at once
+UPSERT_BATCH_SIZE = 100
+UPSERT_WORKERS = 8
+
+def get_vectorstore(documents, namespace: str = ""):
     """
     Initializes embeddings and upserts documents to a Pinecone index.
     - Embedding Model: Google's text-embedding-004 (via Gemini)
     - Vector DB: Pinecone
     - Index Name: From config
-    - Upsert Strategy: from_documents will clear the index and add new docs.
+    - Namespace: one per document, so it can be reloaded later with load_vectorstore
+    - Upsert Strategy: embed all chunks, then upsert batches of 100 vectors concurrently.
+      Nothing is embedded or upserted if the namespace already holds every chunk.
     """
-    embeddings = GoogleGenerativeAIEmbeddings(
-        model="models/text-embedding-004",
-        google_api_key=GOOGLE_API_KEY
-    )
+    embeddings = get_embeddings()
     
-    # NOTE: from_documents will create a new index if it doesn't exist 
-    # and will upsert the documents. For a production scenario, you might want
-    # a more nuanced upsert/update strategy.
-    vectorstore = PineconeVectorStore.from_documents(
-        documents,
-        index_name=PINECONE_INDEX_NAME,
-        embedding=embeddings
-    )
+    index = Pinecone(api_key=PINECONE_API_KEY).Index(PINECONE_INDEX_NAME)
+    if namespace:
+        # A partially populated namespace (e.g. a failed upsert batch) is re-upserted;
+        # chunk ids are stable, so existing vectors are simply overwritten.
+        existing = index.describe_index_stats().namespaces.get(namespace)
+        if existing is not None and existing.vector_count == len(documents):
+            return PineconeVectorStore(index=index, embedding=embeddings, text_key="text", namespace=namespace)
+    
+    texts = [doc.page_content for doc in documents]
+    vectors = embeddings.embed_documents(texts)
+    
+    # Store the chunk text under "text", which is where PineconeVectorStore reads it from.
+    # Within a document namespace chunk ids are stable, so re-upserting overwrites.
+    records = [
+        (f"{namespace}-{i}" if namespace else str(uuid.uuid4()), vector, {**doc.metadata, "text": doc.page_content})
+        for i, (doc, vector) in enumerate(zip(documents, vectors))
+    ]
+    batches = [records[i:i + UPSERT_BATCH_SIZE] for i in range(0, len(records), UPSERT_BATCH_SIZE)]
+    
+    # Overlap the network round-trips of the batch upserts
+    with ThreadPoolExecutor(max_workers=UPSERT_WORKERS) as executor:
+        list(executor.map(lambda batch: index.upsert(vectors=batch, namespace=namespace), batches))
+    
+    vectorstore = PineconeVectorStore(index=index, embedding=embeddings, text_key="text", namespace=namespace)
     return vectorstore
 
+def load_vectorstore(namespace: str):
+    """
+    Reconnects to a document namespace that was previously populated by
+    get_vectorstore, without embedding or upserting anything.
+    """
+    index = Pinecone(api_key=PINECONE_API_KEY).Index(PINECONE_INDEX_NAME)
+    return PineconeVectorStore(index=index, embedding=get_embeddings(), text_key="text", namespace=namespace)
+
 # 3. Retriever + Reranker
 def configure_retriever_and_reranker(vectorstore):
     """
     Configures a retriever with a Cohere Rerank compressor.
-    - Retriever: Standard vector store retriever (top-k=10)
+    - Retriever: Standard similarity retriever (top-k=10); diversity is left to the reranker
     - Reranker: CohereRerank (top_n=3) - if API key is valid
     """
-    retriever = vectorstore.as_retriever(search_type="mmr", search_kwargs={"k": 10})
+    retriever = vectorstore.as_retriever(search_type="similarity", search_kwargs={"k": 10})
     
     # Check if Cohere API key is available and valid
     if COHERE_API_KEY and COHERE_API_KEY.strip():
@@ -133,16 +338,9 @@ def configure_retriever_and_reranker(vectorstore):
         return retriever
 
 # 4. LLM & Answering with Citations
-def get_answer(query: str, retriever):
-    """
-    Generates an answer using an LLM with inline citations.
-    - LLM Provider: Groq (Llama 3.1-8b)
-    - Handles no-answer cases by instructing the LLM.
-    - Tracks tokens and costs.
-    """
-    
-    # Prompt Engineering for Citations
-    prompt_template = """
+
+# Prompt Engineering for Citations
+PROMPT_TEMPLATE = """
     Use the following documents to answer the user's question.
     Each document is formatted as [DOCUMENT n] where n is the document number, followed by its content.
     Your answer MUST be grounded in the information from these documents.
@@ -157,9 +355,31 @@ def get_answer(query: str, retriever):
     Question: {question}
     Answer:
     """
+
+@functools.lru_cache(maxsize=1)
+def _static_prompt_tokens() -> int:
+    """Tokens contributed by the prompt template itself, excluding context and question."""
+    return count_tokens(PROMPT_TEMPLATE.format(context="", question=""))
+
+def stream_answer(query: str, retriever):
+    """
+    Generates an answer using an LLM with inline citations, streaming it as it is produced.
+    - LLM Provider: Groq (Llama 3.1-8b)
+    - Handles no-answer cases by instructing the LLM.
+    - Tracks tokens and costs.
+    - Reuses the answer of a semantically equivalent earlier query when available.
+    Yields ("token", text) for each piece of the answer, then ("done", result)
+    with the same result dict get_answer returns.
+    """
+    query_vector = _embed_query(query)
+    cached_result, cache_generation = _semantic_cache_lookup(query_vector)
+    if cached_result is not None:
+        yield "token", cached_result["answer"]
+        yield "done", cached_result
+        return
     
     prompt = PromptTemplate(
-        template=prompt_template,
+        template=PROMPT_TEMPLATE,
         input_variables=["context", "question"]
     )
     
@@ -169,30 +389,34 @@ def get_answer(query: str, retriever):
         # Prepares the context string for the LLM, including citation numbers
         return "\n\n".join(f"[DOCUMENT {i+1}] {doc.page_content}" for i, doc in enumerate(docs))
 
-    # Retrieve source documents first for token counting
-    source_documents = retriever.get_relevant_documents(query)
+    start_time = time.time()
+    
+    # Retrieve (and rerank) once; the same documents feed token counting and the prompt
+    source_documents = _retrieve(query, query_vector, retriever)
     formatted_context = format_docs(source_documents)
     
     # Count tokens for cost estimation
     context_tokens = count_tokens(formatted_context)
     query_tokens = count_tokens(query)
-    prompt_tokens = count_tokens(prompt_template.format(context=formatted_context, question=query))
+    # The filled-in prompt is never re-encoded: its count is the sum of its parts
+    prompt_tokens = context_tokens + query_tokens + _static_prompt_tokens()
     
-    rag_chain = (
-        {"context": retriever | format_docs, "question": RunnablePassthrough()}
-        | prompt
-        | llm
-    )
+    rag_chain = prompt | llm
     
-    start_time = time.time()
-    response = rag_chain.invoke(query)
+    # Pass tokens on as they arrive, keeping the full text for token counting
+    answer_parts = []
+    for chunk in rag_chain.stream({"context": formatted_context, "question": query}):
+        if chunk.content:
+            answer_parts.append(chunk.content)
+            yield "token", chunk.content
+    answer = "".join(answer_parts)
     end_time = time.time()
     
     # Count output tokens and estimate costs
-    output_tokens = count_tokens(response.content)
+    output_tokens = count_tokens(answer)
     
     # Estimate embedding tokens (approximate based on document chunks)
-    embedding_tokens = sum(count_tokens(doc.page_content) for doc in source_documents)
+    embedding_tokens = count_tokens_batch([doc.page_content for doc in source_documents])
     
     cost_breakdown = estimate_costs(
         embedding_tokens=embedding_tokens,
@@ -200,9 +424,13 @@ def get_answer(query: str, retriever):
         llm_output_tokens=output_tokens
     )
     
-    return {
-        "answer": response.content,
-        "sources": source_documents,
+    result = {
+        "answer": answer,
+        # Plain dicts, so the response can be serialized without another pass
+        "sources": [
+            {"page_content": doc.page_content, "metadata": doc.metadata}
+            for doc in source_documents
+        ],
         "timing": end_time - start_time,
         "cost_breakdown": cost_breakdown,
         "token_usage": {
@@ -213,3 +441,14 @@ def get_answer(query: str, retriever):
             "total_llm_tokens": prompt_tokens + output_tokens
         }
     }
+    _semantic_cache_store(query_vector, result, cache_generation)
+    yield "done", result
+
+def get_answer(query: str, retriever):
+    """
+    Generates an answer using an LLM with inline citations.
+    Non-streaming form of stream_answer: returns only the final result dict.
+    """
+    for event, data in stream_answer(query, retriever):
+        if event == "done":
+            return data
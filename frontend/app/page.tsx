@@ -42,12 +42,24 @@ interface ApiResponse {
   token_usage: TokenUsage;
 }
 
+// Splits a server-sent event frame into its event name and JSON payload
+const parseEvent = (frame: string) => {
+  let event = 'message';
+  let data = '';
+  for (const line of frame.split('\n')) {
+    if (line.startsWith('event:')) event = line.slice(6).trim();
+    else if (line.startsWith('data:')) data += line.slice(5).trim();
+  }
+  return { event, data: data ? JSON.parse(data) : null };
+};
+
 export default function Home() {
   const [file, setFile] = useState<File | null>(null);
   const [textInput, setTextInput] = useState<string>('');
   const [sourceName, setSourceName] = useState<string>('Direct Input');
   const [query, setQuery] = useState<string>('');
   const [response, setResponse] = useState<ApiResponse | null>(null);
+  const [streamingAnswer, setStreamingAnswer] = useState<string>('');
   const [isLoading, setIsLoading] = useState<boolean>(false);
   const [error, setError] = useState<string | null>(null);
   const [uploadMessage, setUploadMessage] = useState<string>('');
@@ -126,6 +138,7 @@ export default function Home() {
     setIsLoading(true);
     setError(null);
     setResponse(null);
+    setStreamingAnswer('');
 
     try {
       const res = await fetch(`${API_URL}/query`, {
@@ -137,8 +150,29 @@ export default function Home() {
         const errData = await res.json();
         throw new Error(errData.detail || 'Query failed');
       }
-      const data: ApiResponse = await res.json();
-      setResponse(data);
+
+      // The answer streams in as "token" events, followed by a "done" event
+      // carrying the full response (sources, timing, costs)
+      const reader = res.body!.getReader();
+      const decoder = new TextDecoder();
+      let buffer = '';
+      while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        const frames = buffer.split('\n\n');
+        buffer = frames.pop() || '';
+        for (const frame of frames) {
+          const { event, data } = parseEvent(frame);
+          if (event === 'token') {
+            setStreamingAnswer((prev) => prev + data);
+          } else if (event === 'done') {
+            setResponse(data as ApiResponse);
+          } else if (event === 'error') {
+            throw new Error(data.detail || 'Query failed');
+          }
+        }
+      }
     } catch (err: any) {
       setError(err.message);
     } finally {
@@ -289,41 +323,45 @@ export default function Home() {
       )}
       
       {/* Step 3: Answer & Sources */}
-      {response && (
+      {(response || streamingAnswer) && (
         <div className="w-full max-w-4xl bg-white p-6 rounded-lg shadow-md mt-8">
           <h3 className="text-xl font-semibold mb-4">Answer</h3>
           <div className="prose max-w-none">
-            <p className="text-gray-700 whitespace-pre-wrap leading-relaxed">{formatAnswer(response.answer)}</p>
+            <p className="text-gray-700 whitespace-pre-wrap leading-relaxed">{formatAnswer(response ? response.answer : streamingAnswer)}</p>
           </div>
           
-          {/* Performance & Cost Metrics */}
-          <div className="mt-6 grid grid-cols-1 md:grid-cols-2 gap-4 p-4 bg-gray-50 rounded-lg">
-            <div>
-              <h4 className="font-semibold text-gray-700">Performance</h4>
-              <p className="text-sm text-gray-600">Response Time: {response.timing.toFixed(2)} seconds</p>
-              <p className="text-sm text-gray-600">Total Tokens: {response.token_usage.total_llm_tokens}</p>
-            </div>
-            <div>
-              <h4 className="font-semibold text-gray-700">Cost Estimate</h4>
-              <p className="text-sm text-gray-600">Total Cost: ${response.cost_breakdown.total_cost.toFixed(6)}</p>
-              <p className="text-sm text-gray-600">
-                Embedding: ${response.cost_breakdown.embedding_cost.toFixed(6)} | 
-                LLM: ${(response.cost_breakdown.llm_input_cost + response.cost_breakdown.llm_output_cost).toFixed(6)}
-              </p>
-            </div>
-          </div>
-          
-          <h3 className="text-xl font-semibold mt-8 mb-4">Sources & Citations</h3>
-          <div className="space-y-4">
-            {response.sources.map((source, index) => (
-              <div key={index} id={`source-${index + 1}`} className="bg-gray-50 p-4 rounded-lg border-l-4 border-blue-500">
-                <p className="font-bold text-sm text-gray-800 mb-2">
-                  [DOCUMENT {index + 1}] From: {source.metadata.source} (Chunk: {source.metadata.position})
+          {response && (
+            <>
+            {/* Performance & Cost Metrics */}
+            <div className="mt-6 grid grid-cols-1 md:grid-cols-2 gap-4 p-4 bg-gray-50 rounded-lg">
+              <div>
+                <h4 className="font-semibold text-gray-700">Performance</h4>
+                <p className="text-sm text-gray-600">Response Time: {response.timing.toFixed(2)} seconds</p>
+                <p className="text-sm text-gray-600">Total Tokens: {response.token_usage.total_llm_tokens}</p>
+              </div>
+              <div>
+                <h4 className="font-semibold text-gray-700">Cost Estimate</h4>
+                <p className="text-sm text-gray-600">Total Cost: ${response.cost_breakdown.total_cost.toFixed(6)}</p>
+                <p className="text-sm text-gray-600">
+                  Embedding: ${response.cost_breakdown.embedding_cost.toFixed(6)} | 
+                  LLM: ${(response.cost_breakdown.llm_input_cost + response.cost_breakdown.llm_output_cost).toFixed(6)}
                 </p>
-                <p className="text-sm text-gray-700 leading-relaxed">{source.page_content}</p>
               </div>
-            ))}
-          </div>
+            </div>
+          
+            <h3 className="text-xl font-semibold mt-8 mb-4">Sources & Citations</h3>
+            <div className="space-y-4">
+              {response.sources.map((source, index) => (
+                <div key={index} id={`source-${index + 1}`} className="bg-gray-50 p-4 rounded-lg border-l-4 border-blue-500">
+                  <p className="font-bold text-sm text-gray-800 mb-2">
+                    [DOCUMENT {index + 1}] From: {source.metadata.source} (Chunk: {source.metadata.position})
+                  </p>
+                  <p className="text-sm text-gray-700 leading-relaxed">{source.page_content}</p>
+                </div>
+              ))}
+            </div>
+            </>
+          )}
         </div>
       )}
     </main>